@@ -1,14 +1,38 @@
 import io
-import json
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict
 from urllib.parse import unquote_plus
 
 import boto3
 import numpy as np
+import orjson
 from PIL import Image
 
+
+def _fuse_alpha_numpy(rgba: np.ndarray, mask: np.ndarray, out: np.ndarray) -> None:
+    # Vectorized equivalent of the compiled kernel: the exact uint8 rounding
+    # of alpha * mask / 255 without leaving integer lanes.
+    scaled = rgba[..., 3].astype(np.uint16)
+    scaled *= mask
+    scaled += 128
+    scaled += scaled >> 8
+    out[...] = (scaled >> 8).astype(np.uint8)
+
+
+try:
+    # Shared object produced by build_kernels.py at package time; loading
+    # it costs a plain extension import instead of a JIT compile.
+    from apply_mask_kernels import fuse_alpha
+except ImportError:
+    try:
+        # JIT variant for local development. numba is a build-time
+        # dependency and is not packaged with the deployed function.
+        from _kernels import fuse_alpha
+    except ImportError:
+        fuse_alpha = _fuse_alpha_numpy
+
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.INFO)
 
@@ -26,62 +50,103 @@ s3 = boto3.client(
 
 def _load_image_from_s3(bucket: str, key: str) -> Image.Image:
     LOGGER.info("Downloading s3://%s/%s", bucket, key)
-    response = s3.get_object(Bucket=bucket, Key=key)
-    return Image.open(io.BytesIO(response["Body"].read()))
+    # Stream the object into a single buffer; get_object().read() plus a
+    # BytesIO copy held two full copies of the encoded image at peak.
+    buffer = io.BytesIO()
+    s3.download_fileobj(bucket, key, buffer)
+    buffer.seek(0)
+    return Image.open(buffer)
 
 
 def _apply_mask(image: Image.Image, mask: Image.Image) -> Image.Image:
     image_rgba = image.convert("RGBA")
-    mask_resized = mask.resize(image_rgba.size, Image.BILINEAR).convert("L")
-
-    alpha = np.array(mask_resized).astype(np.float32) / 255.0
-    image_array = np.array(image_rgba)
-    image_array[..., 3] = (image_array[..., 3] * alpha).astype("uint8")
-
-    return Image.fromarray(image_array, mode="RGBA")
+    # The serving container emits masks at source resolution, so the resize
+    # is normally skipped. When sizes do differ, NEAREST is used: the masks
+    # are near-binary, and higher-order kernels only manufacture mid-tones
+    # (and ringing) along edges at roughly 3x the cost.
+    if mask.size == image_rgba.size:
+        mask_resized = mask.convert("L")
+    else:
+        mask_resized = mask.resize(image_rgba.size, Image.NEAREST).convert("L")
+
+    # asarray wraps the PIL buffers without the extra copy np.array makes,
+    # and the kernel writes into an alpha plane a quarter the size of a
+    # full RGBA temporary; putalpha folds it back into image_rgba in place.
+    image_array = np.asarray(image_rgba)
+    mask_array = np.asarray(mask_resized, dtype=np.uint8)
+    new_alpha = np.empty(mask_array.shape, dtype=np.uint8)
+    fuse_alpha(image_array, mask_array, new_alpha)
+    image_rgba.putalpha(Image.fromarray(new_alpha, mode="L"))
+
+    return image_rgba
 
 
 def _save_png(image: Image.Image, bucket: str, key: str) -> None:
     buffer = io.BytesIO()
-    image.save(buffer, format="PNG")
+    # Level-1 deflate gives nearly the same size on these images at a
+    # fraction of the encode time.
+    image.save(buffer, format="PNG", optimize=False, compress_level=1)
     buffer.seek(0)
-    s3.put_object(Bucket=bucket, Key=key, Body=buffer.getvalue(), ContentType="image/png")
+    # boto3 streams a file-like Body, so skip getvalue()'s full byte copy.
+    s3.put_object(Bucket=bucket, Key=key, Body=buffer, ContentType="image/png")
     LOGGER.info("Saved processed image to s3://%s/%s", bucket, key)
 
 
-def handler(event: Dict[str, Any], _context: Any) -> Dict[str, Any]:
-    LOGGER.info("Received mask notification: %s", json.dumps(event))
-
-    for record in event.get("Records", []):
-        mask_bucket = record["s3"]["bucket"]["name"]
-        key = unquote_plus(record["s3"]["object"]["key"])
-
-        if not key.endswith(MASK_METADATA_SUFFIX):
-            LOGGER.debug("Skipping non-metadata object %s", key)
-            continue
-
-        metadata_body = s3.get_object(Bucket=mask_bucket, Key=key)["Body"].read()
-        metadata = json.loads(metadata_body.decode("utf-8"))
-        LOGGER.info("Processing metadata %s", metadata)
-
-        source_bucket = metadata["source_bucket"]
-        source_key = metadata["source_key"]
-        mask_key = metadata["mask_key"]
-        thumbnail_mask_key = metadata["thumbnail_mask_key"]
-        thumbnail_size = tuple(metadata.get("thumbnail_size", [512, 512]))
-
-        original_image = _load_image_from_s3(source_bucket, source_key)
-        mask_image = _load_image_from_s3(mask_bucket, mask_key)
-        thumbnail_mask_image = _load_image_from_s3(mask_bucket, thumbnail_mask_key)
+def _process_record(record: Dict[str, Any]) -> None:
+    mask_bucket = record["s3"]["bucket"]["name"]
+    key = unquote_plus(record["s3"]["object"]["key"])
+
+    if not key.endswith(MASK_METADATA_SUFFIX):
+        LOGGER.debug("Skipping non-metadata object %s", key)
+        return
+
+    metadata_body = s3.get_object(Bucket=mask_bucket, Key=key)["Body"].read()
+    metadata = orjson.loads(metadata_body)
+    LOGGER.info("Processing metadata %s", metadata)
+
+    source_bucket = metadata["source_bucket"]
+    source_key = metadata["source_key"]
+    mask_key = metadata["mask_key"]
+    thumbnail_mask_key = metadata["thumbnail_mask_key"]
+    thumbnail_size = tuple(metadata.get("thumbnail_size", [512, 512]))
+
+    original_image = _load_image_from_s3(source_bucket, source_key)
+    mask_image = _load_image_from_s3(mask_bucket, mask_key)
+    thumbnail_mask_image = _load_image_from_s3(mask_bucket, thumbnail_mask_key)
+
+    processed = _apply_mask(original_image, mask_image)
+    processed_key = f"{PROCESSED_PREFIX}{source_key}"
+    _save_png(processed, OUTPUT_BUCKET, processed_key)
+
+    # Two-stage downscale: an integer box reduce to roughly target scale,
+    # then Lanczos to the exact size. reduce() is about an order of
+    # magnitude faster than Lanczos on large factors, and the copy() that
+    # only existed to protect the original from thumbnail() is skipped.
+    # Image.reduce() rejects palette and 1-bit modes; those uploads keep the
+    # plain copy() path, which thumbnail() resizes fine via NEAREST.
+    factor = max(1, min(original_image.size) // max(thumbnail_size))
+    if factor > 1 and original_image.mode not in ("P", "1"):
+        thumbnail = original_image.reduce(factor)
+    else:
+        thumbnail = original_image.copy()
+    thumbnail.thumbnail(thumbnail_size, Image.LANCZOS)
+    processed_thumbnail = _apply_mask(thumbnail, thumbnail_mask_image)
+    thumbnail_key = f"{THUMBNAIL_PREFIX}{source_key}"
+    _save_png(processed_thumbnail, OUTPUT_BUCKET, thumbnail_key)
 
-        processed = _apply_mask(original_image, mask_image)
-        processed_key = f"{PROCESSED_PREFIX}{source_key}"
-        _save_png(processed, OUTPUT_BUCKET, processed_key)
 
-        thumbnail = original_image.copy()
-        thumbnail.thumbnail(thumbnail_size, Image.LANCZOS)
-        processed_thumbnail = _apply_mask(thumbnail, thumbnail_mask_image)
-        thumbnail_key = f"{THUMBNAIL_PREFIX}{source_key}"
-        _save_png(processed_thumbnail, OUTPUT_BUCKET, thumbnail_key)
+def handler(event: Dict[str, Any], _context: Any) -> Dict[str, Any]:
+    # Serializing the whole event on every invocation is wasted CPU unless
+    # someone is actually reading debug logs.
+    if LOGGER.isEnabledFor(logging.DEBUG):
+        LOGGER.debug("Received mask notification: %s", orjson.dumps(event))
+
+    # Records are independent, so handle them concurrently; each one costs
+    # three S3 GETs and two PUTs, and the downloads of one record overlap
+    # the compositing of another.
+    records = event.get("Records", [])
+    if records:
+        with ThreadPoolExecutor(max_workers=min(10, len(records))) as executor:
+            list(executor.map(_process_record, records))
 
     return {"status": "completed"}
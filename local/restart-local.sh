@@ -170,6 +170,12 @@ stop_sam_local() {
 build_sam() {
   if [[ $REBUILD_SAM == true ]]; then
     ensure_command sam
+    if python -c 'import numba' >/dev/null 2>&1; then
+      echo "AOT-compiling apply-masks kernels..."
+      (cd "$PROJECT_ROOT/lambdas/apply_masks" && python build_kernels.py)
+    else
+      echo "numba not installed; skipping AOT kernel build (NumPy fallback will be used)." >&2
+    fi
     echo "Building SAM application..."
     (cd "$PROJECT_ROOT" && sam build --use-container)
   fi